@@ -2,12 +2,13 @@ import os
 import cv2
 import time
 import yaml
+import argparse
 import numpy as np
 
 from pcaspy import SimpleServer, Driver
 
-# 读取全局配置参数
-config_path = '../config/config.yaml'
+# 读取全局配置参数（可通过环境变量 DENOISER_CONFIG 指定配置文件）
+config_path = os.environ.get('DENOISER_CONFIG', '../config/config.yaml')
 
 config_file = open(config_path)
 config = yaml.safe_load(config_file)
@@ -18,10 +19,6 @@ os.environ['EPICS_CA_MAX_ARRAY_BYTES'] = config['ENVIRON_CONFIG']['EPICS_CA_MAX_
 IMAGE_SIZE = config['PV_CONFIG']['IMAGE_WIDTH'] * config['PV_CONFIG']['IMAGE_HEIGHT']
 RESULT_SIZE = config['PV_CONFIG']['IMAGE_WIDTH'] * config['PV_CONFIG']['IMAGE_HEIGHT']
 
-# 初始化读取图像路径
-image_src_path = r'D:\YOLO11\images\random_UD-BI_PRF7_RAW_ArrayData_YAG_last300.npy_81.png'
-image_array = cv2.imread(image_src_path, cv2.IMREAD_GRAYSCALE).flatten().astype(np.uint8)
-
 # 定义轮换图像路径数组
 image_paths = [
     r'D:\YOLO11\images\random_UD-BI_PRF7_RAW_ArrayData_YAG_last300.npy_81.png',
@@ -29,16 +26,13 @@ image_paths = [
     r'D:\YOLO11\images\random_UD-BI_PRF9_RAW_ArrayData_YAG.npy_87.png'
 ]
 
-# 当前图像下标
-current_image_index = 0
-
 # 虚拟PV的配置参数
 prefix = 'TEST:'
 pvdb = {
     'IMAGE': {
         'type': 'int',
         'count': IMAGE_SIZE,
-        'value': image_array,
+        'value': np.zeros(IMAGE_SIZE, dtype=np.uint8),
         'desc': 'CCD Image Array',
         'unit': 'counts'
     },
@@ -48,9 +42,42 @@ pvdb = {
         'value': np.zeros(RESULT_SIZE, dtype=np.uint8),
         'desc': 'CCD Result Image Array',
         'unit': 'counts'
+    },
+    'RATE': {
+        'type': 'float',
+        'prec': 2,
+        'value': 10.0,
+        'desc': 'Image Update Rate',
+        'unit': 'Hz'
+    },
+    'FRAME_COUNT': {
+        'type': 'int',
+        'desc': 'Published Image Count'
+    },
+    'RES_PATH': {
+        'type': 'enum',
+        'enums': ['MODEL', 'FALLBACK'],
+        'desc': 'Result Processing Path'
+    },
+    'RES_ID': {
+        'type': 'int',
+        'desc': 'Result Frame Sequence Id'
+    },
+    'RES_SRC_TS': {
+        'type': 'float',
+        'prec': 6,
+        'desc': 'Result Frame Source Timestamp',
+        'unit': 's'
     }
 }
 
+# 束流统计PV（质心、RMS尺寸、积分强度等标量及X/Y投影）
+for field, unit in [('CENTROID_X', 'px'), ('CENTROID_Y', 'px'), ('RMS_X', 'px'), ('RMS_Y', 'px'),
+                    ('INTENSITY', 'counts'), ('PEAK', 'counts'), ('AREA', 'px')]:
+    pvdb['BEAM:' + field] = {'type': 'float', 'prec': 3, 'unit': unit}
+pvdb['BEAM:PROJ_X'] = {'type': 'float', 'count': config['PV_CONFIG']['IMAGE_WIDTH'], 'unit': 'counts'}
+pvdb['BEAM:PROJ_Y'] = {'type': 'float', 'count': config['PV_CONFIG']['IMAGE_HEIGHT'], 'unit': 'counts'}
+
 # 自定义驱动类
 class myDriver(Driver):
     def __init__(self):
@@ -63,6 +90,12 @@ class myDriver(Driver):
         return value
 
     def write(self, reason, value):
+        # 标量PV直接写入
+        if reason != 'RES_IMAGE':
+            print(f"Write PV: {reason}")
+            self.setParam(reason, value)
+            return True
+
         # check value length
         if len(value) != RESULT_SIZE:
             print("ERROR: Array length must be 1440*1080")
@@ -73,12 +106,48 @@ class myDriver(Driver):
 
         return True
 
+# 生成合成光斑图像：二维高斯光斑 + 边缘亮条 + 背景噪声，用于无真实图像时的测试
+def make_synthetic_frames(num_frames, width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    frames = []
+    for _ in range(num_frames):
+        cx = width / 2 + rng.normal(0, width / 20)
+        cy = height / 2 + rng.normal(0, height / 20)
+        sx, sy = rng.uniform(40, 120, size=2)
+        beam = 200 * np.exp(-((x - cx) ** 2 / (2 * sx ** 2) + (y - cy) ** 2 / (2 * sy ** 2)))
+        frame = beam + rng.normal(15, 5, size=(height, width))
+        frame[:, :20] += 120   # 左右边缘亮条
+        frame[:, -20:] += 120
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8).flatten())
+    return frames
+
+def load_frames(args):
+    if args.synthetic:
+        return make_synthetic_frames(8, config['PV_CONFIG']['IMAGE_WIDTH'], config['PV_CONFIG']['IMAGE_HEIGHT'])
+    # 预先读取全部轮换图像，避免高帧率时重复读盘
+    return [cv2.imread(path, cv2.IMREAD_GRAYSCALE).flatten().astype(np.uint8) for path in args.images]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='本地Epics测试服务器')
+    parser.add_argument('--rate', type=float, default=10.0, help='图像更新频率（Hz），运行中可通过 TEST:RATE 修改，0 表示暂停')
+    parser.add_argument('--images', nargs='+', default=image_paths, help='轮换发布的图像路径')
+    parser.add_argument('--synthetic', action='store_true', help='使用合成光斑图像代替图像文件')
+    return parser.parse_args()
+
 # 主程序
 if __name__ == '__main__':
+    args = parse_args()
+    frames = load_frames(args)
+    # 当前图像下标
+    current_image_index = 0
+    frame_count = 0
+
     server = SimpleServer()
     server.createPV(prefix, pvdb)
 
     driver = myDriver()
+    driver.setParam('RATE', args.rate)
 
     # 定义上次更新的时间
     last_update_time = time.time()
@@ -88,20 +157,22 @@ if __name__ == '__main__':
             # 当前时间
             current_time = time.time()
 
-            # 检查是否需要更新 PV
-            if current_time - last_update_time >= 0.1:  # 每隔 n 秒更新一次 # 200ms -- 20Hz
-                image_array = cv2.imread(image_paths[current_image_index], cv2.IMREAD_GRAYSCALE).flatten().astype(np.uint8)
-                driver.setParam('IMAGE', image_array)
+            # 检查是否需要更新 PV（更新周期由 RATE PV 决定）
+            rate = driver.getParam('RATE')
+            if rate > 0 and current_time - last_update_time >= 1.0 / rate:
+                driver.setParam('IMAGE', frames[current_image_index])
+                frame_count += 1
+                driver.setParam('FRAME_COUNT', frame_count)
                 driver.updatePVs()
 
                 # 更新图像下标
-                current_image_index = (current_image_index + 1) % len(image_paths)
+                current_image_index = (current_image_index + 1) % len(frames)
 
                 # 更新上次更新时间
                 last_update_time = current_time
 
             # 快速处理客户端请求
-            server.process(0)  # 保持较小的阻塞时间
+            server.process(0.001)  # 保持较小的阻塞时间（1ms，避免空转占满CPU）
     except KeyboardInterrupt:
         # 关闭文件
         config_file.close()
@@ -0,0 +1,305 @@
+# 端到端压力测试：启动本地Epics测试服务器与图像去噪服务，逐级提高帧率，
+# 统计每级的持续处理帧率、丢帧率与端到端延迟分位数，并给出当前版本的饱和帧率；
+# 另单独统计模型路径的输出帧率，与快速路径占比分开报告。
+#
+# 用法示例（任意目录下运行，跨平台）:
+#   python scripts/load_test.py --device cpu --steps 1 2 5 10 15 20
+#   python scripts/load_test.py --device cuda:0 --min-saturation 15   # 低于 15Hz 时返回非零退出码
+import os
+import sys
+import json
+import time
+import yaml
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from pathlib import Path
+from datetime import datetime
+from threading import Lock
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+# 本地测试服务器的PV前缀（与 local_server/Epics_Server.py 一致）
+SERVER_PREFIX = 'TEST:'
+# RES_PATH 中快速路径的取值（与 OverloadController.FALLBACK_PATH 一致）
+FALLBACK_PATH = 1
+# 读取本地测试服务器PV的超时（秒）
+CAGET_TIMEOUT = 5.0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Profile图像去噪服务端到端压力测试')
+    parser.add_argument('--device', default='cpu', help='模型运行设备，如 cpu / cuda:0')
+    parser.add_argument('--model', default=str(ROOT_DIR / 'src' / 'model' / 'best.pt'), help='YOLO 模型路径')
+    parser.add_argument('--steps', type=float, nargs='+', default=[1, 2, 5, 10, 15, 20, 30], help='逐级测试的帧率（Hz）')
+    parser.add_argument('--step-duration', type=float, default=20.0, help='每级统计时长（秒）')
+    parser.add_argument('--warmup', type=float, default=5.0, help='每级切换帧率后的预热时长（秒），不计入统计')
+    parser.add_argument('--startup-timeout', type=float, default=300.0, help='等待服务输出第一帧结果的超时（秒）')
+    parser.add_argument('--port', type=int, default=5074, help='本地CA服务端口，避免与现场IOC冲突')
+    parser.add_argument('--max-drop-rate', type=float, default=0.02, help='判定为持续处理的最大丢帧率')
+    parser.add_argument('--max-p95-latency', type=float, default=0.5, help='判定为持续处理的最大 P95 端到端延迟（秒）')
+    parser.add_argument('--max-fallback-rate', type=float, default=0.05, help='判定为持续处理的最大快速路径占比')
+    parser.add_argument('--latency-deadline', type=float, default=None,
+                        help='写入测试配置的过载控制延迟阈值（秒），默认与 --max-p95-latency 相同，'
+                             '避免 CPU 推理超过配置文件中的阈值后服务一直停留在快速路径')
+    parser.add_argument('--stop-after-failures', type=int, default=2, help='连续多少级未达标后停止爬升')
+    parser.add_argument('--min-saturation', type=float, default=None, help='回归门限：饱和帧率低于该值时返回退出码 1')
+    parser.add_argument('--work-dir', default=None, help='临时配置与日志目录（默认新建临时目录）')
+    args = parser.parse_args()
+    if args.latency_deadline is None:
+        args.latency_deadline = args.max_p95_latency
+    return args
+
+def build_config(args, work_dir):
+    """基于全局配置生成压测专用配置：指定设备与模型、日志写入工作目录、关闭归档"""
+    with open(ROOT_DIR / 'config' / 'config.yaml', encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    config['ENVIRON_CONFIG']['YOLO_DEVICE'] = args.device
+    config['ENVIRON_CONFIG']['YOLO_MODEL_PATH'] = str(Path(args.model).resolve())
+    if args.device == 'cpu':
+        config['ENVIRON_CONFIG']['CUDA_VISIBLE_DEVICES'] = ''
+    config['LOGGING_CONFIG']['SERVICE_LOG_FILE'] = str(work_dir / 'service.log')
+    config['LOGGING_CONFIG']['VIS_LOG_FILE'] = str(work_dir / 'visualization.log')
+    config['TRACE_CONFIG']['TRACE_DIR'] = str(work_dir / 'traces')
+    config['ARCHIVE_CONFIG']['ENABLE'] = False
+    # 过载控制阈值显式写入测试配置，与本测试的延迟判定标准一致
+    config['OVERLOAD_CONFIG']['LATENCY_DEADLINE'] = args.latency_deadline
+
+    config_path = work_dir / 'config.yaml'
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return config, config_path
+
+def build_env(args, config, config_path):
+    """子进程与本进程共用的环境变量：仅在本机回环地址上通信"""
+    env = dict(os.environ)
+    env.update({
+        'DENOISER_CONFIG': str(config_path),
+        'EPICS_CA_MAX_ARRAY_BYTES': config['ENVIRON_CONFIG']['EPICS_CA_MAX_ARRAY_BYTES'],
+        'EPICS_CA_SERVER_PORT': str(args.port),
+        'EPICS_CAS_SERVER_PORT': str(args.port),
+        'EPICS_CA_ADDR_LIST': '127.0.0.1',
+        'EPICS_CA_AUTO_ADDR_LIST': 'NO',
+        'EPICS_CAS_INTF_ADDR_LIST': '127.0.0.1',
+        'PYTHONUNBUFFERED': '1',
+    })
+    return env
+
+def start_process(script, cwd, env, log_path, extra_args=()):
+    log_file = open(log_path, 'w', encoding='utf-8')
+    return subprocess.Popen(
+        [sys.executable, script, *extra_args], cwd=cwd, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+def stop_process(process):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class ResultCollector:
+    """
+    监控结果PV：服务端按帧整体发布，元数据（帧序号、IOC 采集时间戳、处理路径）先于结果图像写入，
+    且上一帧图像写入完成前不会发送下一帧，因此收到结果图像时的最新元数据即属于同一帧，
+    以此记录该帧的端到端延迟。
+    """
+    def __init__(self, epics, config):
+        pv_config = config['PV_CONFIG']
+        self.lock = Lock()
+        self.records = []
+        self.last_seq_id = None
+        self.metadata_pvs = {
+            'seq_id': epics.PV(pv_config['RESULT_ID_PV_NAME'], auto_monitor=True),
+            'source_ts': epics.PV(pv_config['RESULT_SOURCE_TS_PV_NAME'], auto_monitor=True),
+            'path': epics.PV(pv_config['RESULT_PATH_PV_NAME'], auto_monitor=True),
+        }
+        self.image_pv = epics.PV(pv_config['RESULT_PV_NAME'], form='native', auto_monitor=True)
+        self.image_pv.add_callback(self.on_result_image)
+
+    def on_result_image(self, pvname=None, value=None, **kwargs):
+        receive_time = time.time()
+        seq_id = self.metadata_pvs['seq_id'].value
+        source_ts = self.metadata_pvs['source_ts'].value
+        # 测试服务器中帧序号与时间戳初始值为 0，服务分配的帧序号从 1 开始；
+        # 忽略连接时收到的初始值，只记录服务实际输出的帧
+        if seq_id is None or source_ts is None or seq_id <= 0 or source_ts <= 0 or seq_id == self.last_seq_id:
+            return
+        self.last_seq_id = seq_id
+        with self.lock:
+            self.records.append((seq_id, receive_time - source_ts, self.metadata_pvs['path'].value))
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+
+def run_step(epics, collector, rate, args):
+    """以指定帧率运行一级测试，返回该级统计结果"""
+    epics.caput(SERVER_PREFIX + 'RATE', rate, wait=True)
+    time.sleep(args.warmup)
+
+    start_count = epics.caget(SERVER_PREFIX + 'FRAME_COUNT', timeout=CAGET_TIMEOUT)
+    collector.reset()
+    start_time = time.time()
+    time.sleep(args.step_duration)
+    records = collector.snapshot()
+    elapsed = time.time() - start_time
+    end_count = epics.caget(SERVER_PREFIX + 'FRAME_COUNT', timeout=CAGET_TIMEOUT)
+
+    # 读取输入帧计数超时时该级无法统计，直接判定为未达标，保留其余各级的报告
+    if start_count is None or end_count is None:
+        return failed_step(rate, f"读取 {SERVER_PREFIX}FRAME_COUNT 超时")
+
+    offered = end_count - start_count
+    delivered = len(records)
+    latencies = np.array([latency for _, latency, _ in records]) if records else np.array([np.nan])
+    fallback = sum(1 for _, _, path in records if path == FALLBACK_PATH)
+
+    result = {
+        'target_fps': rate,
+        'offered_fps': offered / elapsed,
+        'sustained_fps': delivered / elapsed,
+        'drop_rate': max(0.0, 1.0 - delivered / offered) if offered > 0 else 0.0,
+        'fallback_rate': fallback / delivered if delivered else 0.0,
+        # 模型路径输出帧率，不含快速路径的帧
+        'model_fps': (delivered - fallback) / elapsed,
+        'latency_p50': float(np.percentile(latencies, 50)),
+        'latency_p95': float(np.percentile(latencies, 95)),
+        'latency_p99': float(np.percentile(latencies, 99)),
+        'latency_max': float(np.max(latencies)),
+    }
+    result['sustained'] = bool(
+        delivered > 0
+        and result['drop_rate'] <= args.max_drop_rate
+        and result['latency_p95'] <= args.max_p95_latency
+        and result['fallback_rate'] <= args.max_fallback_rate
+    )
+    return result
+
+def failed_step(rate, error):
+    """该级测试无法完成时的统计结果：各指标为 NaN，判定为未达标"""
+    print(f"[Error] {rate:.1f} Hz 测试失败: {error}")
+    result = {key: float('nan') for key in (
+        'offered_fps', 'sustained_fps', 'drop_rate', 'fallback_rate', 'model_fps',
+        'latency_p50', 'latency_p95', 'latency_p99', 'latency_max',
+    )}
+    result.update({'target_fps': rate, 'sustained': False, 'error': error})
+    return result
+
+def wait_for_first_result(collector, processes, timeout):
+    """等待服务输出第一帧真实结果（模型加载完成），子进程退出或超时时报错"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for name, process in processes.items():
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} 进程已退出（退出码 {process.returncode}），请查看工作目录中的日志")
+        if collector.snapshot():
+            return
+        time.sleep(0.5)
+    raise RuntimeError(f"{timeout:.0f}s 内未收到任何处理结果")
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+def print_report(steps, saturation, model_saturation):
+    print(f"\n{'目标Hz':>8} {'输入Hz':>8} {'输出Hz':>8} {'模型Hz':>8} {'丢帧率':>8} {'快速路径':>8} "
+          f"{'P50ms':>8} {'P95ms':>8} {'P99ms':>8} {'达标':>4}")
+    for step in steps:
+        print(f"{step['target_fps']:>8.1f} {step['offered_fps']:>8.2f} {step['sustained_fps']:>8.2f} "
+              f"{step['model_fps']:>8.2f} {step['drop_rate']:>8.1%} {step['fallback_rate']:>8.1%} "
+              f"{step['latency_p50'] * 1000:>8.1f} {step['latency_p95'] * 1000:>8.1f} "
+              f"{step['latency_p99'] * 1000:>8.1f} {'是' if step['sustained'] else '否':>4}")
+    if saturation is None:
+        print("\n饱和帧率: 最低一级即未达标")
+    else:
+        print(f"\n饱和帧率: {saturation['target_fps']:.1f} Hz（持续输出 {saturation['sustained_fps']:.2f} 帧/s）")
+    print(f"模型路径最高输出: {model_saturation:.2f} 帧/s（不含快速路径帧）")
+
+def main():
+    args = parse_args()
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix='denoiser_load_test_'))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    print(f"工作目录: {work_dir}")
+
+    config, config_path = build_config(args, work_dir)
+    env = build_env(args, config, config_path)
+    # 本进程同样作为CA客户端，需在导入 epics 前设置环境变量
+    os.environ.update(env)
+    import epics
+
+    processes = {}
+    steps = []
+    try:
+        processes['server'] = start_process(
+            'Epics_Server.py', ROOT_DIR / 'local_server', env, work_dir / 'server.out',
+            extra_args=['--synthetic', '--rate', str(args.steps[0])],
+        )
+        processes['service'] = start_process(
+            'Epics_Image_Segment_Service.py', ROOT_DIR / 'src', env, work_dir / 'service.out',
+        )
+        collector = ResultCollector(epics, config)
+        wait_for_first_result(collector, processes, args.startup_timeout)
+
+        failures = 0
+        for rate in args.steps:
+            step = run_step(epics, collector, rate, args)
+            steps.append(step)
+            print(f"[{rate:.1f} Hz] 输出 {step['sustained_fps']:.2f} 帧/s（模型路径 {step['model_fps']:.2f}），"
+                  f"快速路径占比 {step['fallback_rate']:.1%}，丢帧率 {step['drop_rate']:.1%}，"
+                  f"P95 {step['latency_p95'] * 1000:.1f}ms，{'达标' if step['sustained'] else '未达标'}")
+            failures = 0 if step['sustained'] else failures + 1
+            if failures >= args.stop_after_failures:
+                break
+    finally:
+        for process in processes.values():
+            stop_process(process)
+
+    # 饱和点：首次未达标之前的最高一级
+    saturation = None
+    for step in steps:
+        if not step['sustained']:
+            break
+        saturation = step
+    # 模型路径饱和：各级中模型路径的最高输出帧率，与快速路径占比分开报告
+    model_fps = [step['model_fps'] for step in steps if not np.isnan(step['model_fps'])]
+    model_saturation = max(model_fps, default=0.0)
+    print_report(steps, saturation, model_saturation)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'device': args.device,
+        'model': config['ENVIRON_CONFIG']['YOLO_MODEL_PATH'],
+        'thresholds': {
+            'max_drop_rate': args.max_drop_rate,
+            'max_p95_latency': args.max_p95_latency,
+            'max_fallback_rate': args.max_fallback_rate,
+            'latency_deadline': args.latency_deadline,
+        },
+        'steps': steps,
+        'saturation_fps': saturation['target_fps'] if saturation else 0.0,
+        'model_saturation_fps': model_saturation,
+    }
+    output_dir = ROOT_DIR / 'logging' / 'load_test'
+    output_dir.mkdir(parents=True, exist_ok=True)
+    save_path = output_dir / f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(save_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"测试报告保存路径：{save_path}")
+
+    if args.min_saturation is not None and report['saturation_fps'] < args.min_saturation:
+        print(f"回归: 饱和帧率 {report['saturation_fps']:.1f} Hz 低于门限 {args.min_saturation:.1f} Hz")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 离线批量重处理 -- 命令行工具
+#
+# 用法示例（在 src 目录下运行）:
+#   python Batch_Reprocess.py ../data/UD-BI_PRF7_RAW_ArrayData_YAG_last300.npy ../data/result.npy
+#   python Batch_Reprocess.py ../archive/frames_20250905_115325_000000.h5 ../data/result.npy --workers 4
+#   python Batch_Reprocess.py ../data/images/ ../data/result.npy --device cpu
+#   python Batch_Reprocess.py ../data/stack.npy ../data/result.npy --device cuda:0,cuda:1   # 每块GPU一个工作进程
+#
+# 中断后使用相同参数重新运行即可从断点继续；输入、数据集或模型文件（按内容）变化时拒绝续跑。
+
+import os
+import cv2
+import glob
+import json
+import time
+import yaml
+import hashlib
+import argparse
+import logging
+
+import numpy as np
+import multiprocessing as mp
+
+# 读取全局配置参数（可通过环境变量 DENOISER_CONFIG 指定配置文件）
+config_path = os.environ.get('DENOISER_CONFIG', '../config/config.yaml')
+
+with open(config_path) as config_file:
+    config = yaml.safe_load(config_file)
+
+YOLO_MODEL_PATH = config['ENVIRON_CONFIG']['YOLO_MODEL_PATH']
+YOLO_DEVICE = config['ENVIRON_CONFIG']['YOLO_DEVICE']
+
+# 目录输入支持的单帧文件类型
+FRAME_FILE_PATTERNS = ('*.png', '*.bmp', '*.tif', '*.tiff', '*.npy')
+
+class FrameSource:
+    """
+    帧数据源：统一读取 .npy 帧堆栈（内存映射）、HDF5 归档文件或单帧文件目录。
+    """
+    def __init__(self, path, dataset='raw'):
+        self.path = path
+        self.h5_file = None
+        self.frame_files = None
+
+        if os.path.isdir(path):
+            self.frame_files = sorted(
+                f for pattern in FRAME_FILE_PATTERNS for f in glob.glob(os.path.join(path, pattern))
+            )
+            if not self.frame_files:
+                raise ValueError(f"目录中没有可读取的帧文件: {path}")
+            first_frame = self._read_file(self.frame_files[0])
+            self.shape = (len(self.frame_files),) + first_frame.shape
+        elif path.endswith(('.h5', '.hdf5')):
+            import h5py
+            self.h5_file = h5py.File(path, 'r')
+            self.frames = self.h5_file[dataset]
+            self.shape = self.frames.shape
+        else:
+            self.frames = np.load(path, mmap_mode='r')
+            # 单帧 .npy 视为长度为 1 的堆栈
+            if self.frames.ndim == 2:
+                self.frames = self.frames[np.newaxis]
+            self.shape = self.frames.shape
+
+        if len(self.shape) != 3:
+            raise ValueError(f"帧数据形状应为 (N, H, W)，实际为 {self.shape}")
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _read_file(self, file_path):
+        if file_path.endswith('.npy'):
+            return np.load(file_path)
+        return cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+
+    def read(self, start, stop):
+        """读取 [start, stop) 范围内的帧，返回 (n, H, W) uint8 数组"""
+        if self.frame_files is not None:
+            frames = np.stack([self._read_file(f) for f in self.frame_files[start:stop]])
+        else:
+            frames = np.asarray(self.frames[start:stop])
+        return frames.astype(np.uint8, copy=False)
+
+    def close(self):
+        if self.h5_file is not None:
+            self.h5_file.close()
+
+
+# 工作进程全局对象（每个进程各自加载一次模型）
+worker_detector = None
+worker_source = None
+worker_output = None
+worker_batch_size = None
+# 初始化失败原因：初始化函数抛出异常会使进程池不断重启工作进程而卡住，
+# 因此只记录异常，由 process_chunk 抛出，使主进程立即报错退出
+worker_init_error = None
+
+def init_worker(input_path, dataset, output_path, model_path, devices, num_threads, batch_size):
+    global worker_detector, worker_source, worker_output, worker_batch_size, worker_init_error
+    try:
+        # 延迟导入，避免主进程加载模型与CUDA上下文
+        import torch
+        import Image_Processor
+
+        # 按进程池中的工作进程编号（从 1 开始）轮流分配运行设备，被替换的进程同样能分到设备
+        worker_index = mp.current_process()._identity[0] - 1
+        device = devices[worker_index % len(devices)]
+        # CPU 上按进程数均分线程，避免线程池超额占用
+        if device == 'cpu':
+            torch.set_num_threads(num_threads)
+
+        worker_detector = Image_Processor.ImageProcess(model_path, device=device)
+        worker_source = FrameSource(input_path, dataset)
+        worker_output = np.load(output_path, mmap_mode='r+')
+        worker_batch_size = batch_size
+    except Exception as e:
+        worker_init_error = f"工作进程初始化失败（{type(e).__name__}）: {e}"
+
+def process_chunk(chunk):
+    """
+    处理一个帧区间，结果直接写入输出内存映射文件。
+
+    参数:
+        chunk: (chunk_index, start, stop)
+    返回:
+        (chunk_index, 帧数, 耗时)
+    """
+    if worker_init_error is not None:
+        raise RuntimeError(worker_init_error)
+    chunk_index, start, stop = chunk
+    start_time = time.time()
+    for batch_start in range(start, stop, worker_batch_size):
+        batch_stop = min(batch_start + worker_batch_size, stop)
+        raw_images = worker_source.read(batch_start, batch_stop)
+        seg_images, _, _, _ = worker_detector.process_batch(raw_images)
+        worker_output[batch_start:batch_stop] = seg_images
+    worker_output.flush()
+    return chunk_index, stop - start, time.time() - start_time
+
+
+def file_sha256(file_path):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def build_run_params(args, num_frames):
+    """
+    决定输出结果的全部运行参数，写入进度文件用于续跑校验。
+    模型以内容哈希标识，重新训练后覆盖同名 best.pt 也能识别。
+    """
+    return {
+        'input': os.path.abspath(args.input),
+        'dataset': args.dataset,
+        'model': os.path.abspath(args.model),
+        'model_sha256': file_sha256(args.model),
+        'num_frames': num_frames,
+        'chunk_size': args.chunk_size,
+    }
+
+def load_progress(progress_path, run_params):
+    """读取断点进度文件，输入、数据集、模型或分块参数不一致时拒绝续跑"""
+    if not os.path.exists(progress_path):
+        return set()
+    with open(progress_path, encoding='utf-8') as f:
+        progress = json.load(f)
+    mismatched = [key for key, value in run_params.items() if progress.get(key) != value]
+    if mismatched:
+        raise ValueError(
+            f"进度文件 {progress_path} 与当前参数不一致（{', '.join(mismatched)}），"
+            f"继续运行会混合不同模型或数据的结果，请删除进度文件与输出文件后重新运行"
+        )
+    return set(progress['done_chunks'])
+
+def save_progress(progress_path, run_params, done_chunks):
+    """原子写入断点进度文件"""
+    progress = dict(run_params, done_chunks=sorted(done_chunks))
+    with open(progress_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    os.replace(progress_path + '.tmp', progress_path)
+
+
+def check_inputs(source, model_path):
+    """
+    启动进程池前在主进程中预检输入与模型，出错时直接报错退出。
+    模型仅在 CPU 上加载，不创建 CUDA 上下文。
+    """
+    source.read(0, 1)
+    # 模型文件不存在时 YOLO 会尝试按名称下载，需先行检查
+    if not os.path.isfile(model_path):
+        raise FileNotFoundError(f"模型文件不存在: {model_path}")
+    from ultralytics import YOLO
+    YOLO(model_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Profile图像离线批量重处理')
+    parser.add_argument('input', help='输入：.npy 帧堆栈、.h5 归档文件或单帧文件目录')
+    parser.add_argument('output', help='输出 .npy 结果帧堆栈')
+    parser.add_argument('--dataset', default='raw', help='HDF5 输入的数据集名称（默认 raw）')
+    parser.add_argument('--model', default=YOLO_MODEL_PATH, help='YOLO 模型路径')
+    parser.add_argument('--device', default=YOLO_DEVICE, help='模型运行设备，如 cpu / cuda:0，多块GPU用逗号分隔，如 cuda:0,cuda:1')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数（默认：GPU 每块一个进程，CPU 为核数/4）')
+    parser.add_argument('--batch-size', type=int, default=8, help='单次模型推理的帧数')
+    parser.add_argument('--chunk-size', type=int, default=64, help='每个任务处理的帧数（断点粒度）')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    source = FrameSource(args.input, args.dataset)
+    try:
+        check_inputs(source, args.model)
+    finally:
+        source.close()
+    num_frames = len(source)
+    frame_shape = source.shape[1:]
+
+    # 创建或复用输出文件
+    progress_path = args.output + '.progress.json'
+    run_params = build_run_params(args, num_frames)
+    done_chunks = load_progress(progress_path, run_params)
+    if done_chunks and os.path.exists(args.output):
+        output = np.load(args.output, mmap_mode='r')
+        if output.shape != source.shape:
+            raise ValueError(f"已有输出文件形状 {output.shape} 与输入 {source.shape} 不一致")
+        del output
+    else:
+        done_chunks = set()
+        output = np.lib.format.open_memmap(args.output, mode='w+', dtype=np.uint8, shape=(num_frames,) + frame_shape)
+        del output
+        save_progress(progress_path, run_params, done_chunks)
+
+    chunks = [
+        (chunk_index, start, min(start + args.chunk_size, num_frames))
+        for chunk_index, start in enumerate(range(0, num_frames, args.chunk_size))
+        if chunk_index not in done_chunks
+    ]
+    total_chunks = -(-num_frames // args.chunk_size)
+    logging.info(f"[Info] 共 {num_frames} 帧，待处理 {len(chunks)} 个区间（已完成 {len(done_chunks)} 个）")
+
+    # 工作进程数：GPU 默认每块一个进程，多于设备数时按进程编号轮流分配
+    devices = [device.strip() for device in args.device.split(',')]
+    cpu_count = os.cpu_count() or 1
+    if args.workers is not None:
+        workers = args.workers
+    elif devices == ['cpu']:
+        workers = max(1, cpu_count // 4)
+    else:
+        workers = len(devices)
+    num_threads = max(1, cpu_count // workers)
+    logging.info(f"[Info] 工作进程数: {workers}，运行设备: {', '.join(devices)}")
+
+    # CUDA 不支持 fork，统一使用 spawn 启动工作进程
+    start_time = time.time()
+    processed_frames = 0
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(
+        processes=workers,
+        initializer=init_worker,
+        initargs=(args.input, args.dataset, args.output, args.model, devices, num_threads, args.batch_size),
+    ) as pool:
+        for chunk_index, frame_count, elapsed in pool.imap_unordered(process_chunk, chunks):
+            done_chunks.add(chunk_index)
+            save_progress(progress_path, run_params, done_chunks)
+            processed_frames += frame_count
+            total_elapsed = time.time() - start_time
+            logging.info(
+                f"[Info] 区间 {chunk_index} 完成（{frame_count} 帧，{elapsed:.2f}s），"
+                f"进度 {len(done_chunks)}/{total_chunks}，"
+                f"吞吐 {processed_frames / total_elapsed:.1f} 帧/s"
+            )
+
+    # 全部完成后删除进度文件
+    os.remove(progress_path)
+    logging.info(f"[Info] 重处理完成，结果已写入: {args.output}")
+
+if __name__ == '__main__':
+    main()
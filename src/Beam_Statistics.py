@@ -0,0 +1,49 @@
+import numpy as np
+
+# 束流统计量名称（与发布的 PV 后缀一致）
+SCALAR_FIELDS = ['CENTROID_X', 'CENTROID_Y', 'RMS_X', 'RMS_Y', 'INTENSITY', 'PEAK', 'AREA']
+ARRAY_FIELDS = ['PROJ_X', 'PROJ_Y']
+
+def compute_beam_statistics(image, light_mask):
+    """
+    基于去噪后的图像与光斑（light 类）掩码，向量化计算束流统计量。
+    先求 X/Y 方向投影，再由一维投影计算一阶/二阶矩，整幅图像只需遍历一次。
+
+    参数:
+        image: 去噪后的图像 (H, W) uint8
+        light_mask: 光斑掩码 (H, W) bool
+    返回:
+        dict，键为 SCALAR_FIELDS + ARRAY_FIELDS，坐标与尺寸单位均为像素；
+        未检测到光斑时质心与 RMS 尺寸为 NaN
+    """
+    # 仅统计光斑区域内的像素强度
+    weights = np.where(light_mask, image, 0).astype(np.float64)
+
+    # X/Y 方向投影
+    proj_x = weights.sum(axis=0)
+    proj_y = weights.sum(axis=1)
+    intensity = proj_x.sum()
+
+    if intensity > 0:
+        x = np.arange(proj_x.size, dtype=np.float64)
+        y = np.arange(proj_y.size, dtype=np.float64)
+        # 一阶矩：质心
+        centroid_x = proj_x @ x / intensity
+        centroid_y = proj_y @ y / intensity
+        # 二阶中心矩：RMS 尺寸
+        rms_x = np.sqrt(proj_x @ (x - centroid_x) ** 2 / intensity)
+        rms_y = np.sqrt(proj_y @ (y - centroid_y) ** 2 / intensity)
+    else:
+        centroid_x = centroid_y = rms_x = rms_y = np.nan
+
+    return {
+        'CENTROID_X': centroid_x,
+        'CENTROID_Y': centroid_y,
+        'RMS_X': rms_x,
+        'RMS_Y': rms_y,
+        'INTENSITY': intensity,
+        'PEAK': float(weights.max()),
+        'AREA': int(np.count_nonzero(light_mask)),
+        'PROJ_X': proj_x,
+        'PROJ_Y': proj_y,
+    }
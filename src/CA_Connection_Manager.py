@@ -0,0 +1,326 @@
+import time
+import epics
+import logging
+import itertools
+
+from threading import Thread, Condition
+
+class PVChannel:
+    """单个 PV 的连接状态"""
+    def __init__(self, pv_name, monitor_callback=None):
+        self.pv_name = pv_name
+        self.monitor_callback = monitor_callback
+        self.pv = None
+
+        # 连接状态
+        self.connected = False
+        self.disconnected_since = time.time()
+        # 本次未连接是否已超过 CONNECT_TIMEOUT 并输出过警告
+        self.timeout_reported = False
+        self.disconnect_count = 0
+
+
+class PublishFrame:
+    """
+    一帧的全部结果写入：元数据 PV 在前，结果图像 PV 在最后。
+    整帧作为一个单元合并与发送，以图像写入完成作为整帧发布完成。
+    只有结果图像 PV 决定能否发送，未连接的元数据 PV 在发送时跳过。
+    """
+    def __init__(self, frame_id, puts, on_complete=None, on_drop=None):
+        self.frame_id = frame_id
+        # [(pv_name, value), ...]，最后一项为结果图像
+        self.puts = puts
+        self.on_complete = on_complete
+        self.on_drop = on_drop
+        self.put_start_time = 0.0
+
+    @property
+    def image_pv_name(self):
+        return self.puts[-1][0]
+
+
+class CAConnectionManager:
+    """
+    EPICS CA 连接管理器：
+    1. 跟踪各 PV 的连接状态：通道只创建一次，断线后的搜索、重连与监控订阅恢复均由 CA 客户端库完成，
+       本类只记录断线次数与恢复耗时，超过 CONNECT_TIMEOUT 仍未连接时输出警告；
+    2. 结果按帧发布：最多一帧在途 + 一帧待发送，新帧整体覆盖未发送的旧帧；
+       上一帧图像写入完成（或超时）后，下一帧的元数据与图像才一并发出，
+       保证客户端收到的图像与其元数据属于同一帧；
+       是否发送只取决于结果图像 PV 的连接状态，元数据 PV 缺失或断线时仅跳过该项，不影响图像发布；
+    3. 记录连接状态与整帧写入完成延迟，并定期输出到日志。
+    所有 CA 写入由后台线程发出，CA 回调中只修改状态，不调用 CA 接口。
+    """
+    # 后台线程最长等待间隔（秒），用于检查连接超时与写入超时
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, config):
+        ca_config = config['CA_CONFIG']
+        self.CONNECT_TIMEOUT = ca_config['CONNECT_TIMEOUT']
+        self.PUT_TIMEOUT = ca_config['PUT_TIMEOUT']
+        self.STATUS_LOG_INTERVAL = ca_config['STATUS_LOG_INTERVAL']
+
+        self.channels = {}
+        self.condition = Condition()
+        self.running = True
+        self.last_status_log_time = time.time()
+
+        # 帧发布状态
+        self.frame_counter = itertools.count(1)
+        self.pending_frame = None
+        self.in_flight_frame = None
+        self.published_frames = 0
+        self.dropped_frames = 0
+        # 因 PV 未连接而跳过的元数据写入次数
+        self.skipped_metadata_puts = 0
+        self.put_latency_last = None
+        self.put_latency_max = 0.0
+
+        self.manager_thread = Thread(target=self._manage_loop, daemon=True)
+        self.manager_thread.start()
+
+    # ---------------- 对外接口 ----------------
+    def monitor(self, pv_name, callback):
+        """
+        监控 PV 的变化，连接失败或断线时不抛出异常，由 CA 客户端库自动重连并恢复订阅。
+
+        参数:
+            pv_name: 要监控的 PV 名称
+            callback: 当 PV 值变化时调用的回调函数，接收参数 (pvname, value, **kwargs)
+        """
+        channel = PVChannel(pv_name, monitor_callback=callback)
+        with self.condition:
+            self.channels[pv_name] = channel
+        self._create_pv(channel)
+
+    def add_pv(self, pv_name):
+        """预先建立写入 PV 的通道（已存在时直接返回）"""
+        with self.condition:
+            channel = self.channels.get(pv_name)
+            if channel is not None:
+                return channel
+            channel = PVChannel(pv_name)
+            self.channels[pv_name] = channel
+        self._create_pv(channel)
+        return channel
+
+    def publish_frame(self, puts, on_complete=None, on_drop=None):
+        """
+        非阻塞发布一帧结果。若上一帧仍在写入或 PV 尚未连接，则仅保留最新一帧，被覆盖的帧视为丢弃。
+
+        参数:
+            puts: [(pv_name, value), ...]，按顺序写入，最后一项为结果图像
+            on_complete: 图像写入完成回调，参数为完成时间
+            on_drop: 该帧被覆盖、超时或写入失败时的回调，参数为丢弃时间
+        """
+        for pv_name, _ in puts:
+            self.add_pv(pv_name)
+
+        frame = PublishFrame(next(self.frame_counter), list(puts), on_complete, on_drop)
+        with self.condition:
+            dropped = self.pending_frame
+            self.pending_frame = frame
+            if dropped is not None:
+                self.dropped_frames += 1
+            self.condition.notify()
+        self._notify_drop(dropped)
+
+    def get_status(self):
+        """返回各 PV 的连接状态与整帧写入统计"""
+        with self.condition:
+            return {
+                'channels': {
+                    name: {
+                        'connected': channel.connected,
+                        'disconnect_count': channel.disconnect_count,
+                    }
+                    for name, channel in self.channels.items()
+                },
+                'published_frames': self.published_frames,
+                'dropped_frames': self.dropped_frames,
+                'skipped_metadata_puts': self.skipped_metadata_puts,
+                'in_flight': self.in_flight_frame is not None,
+                'put_latency_last': self.put_latency_last,
+                'put_latency_max': self.put_latency_max,
+            }
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.manager_thread.join()
+        for channel in self.channels.values():
+            if channel.pv is not None:
+                channel.pv.disconnect()
+
+    # ---------------- CA 回调（仅修改状态） ----------------
+    def _on_connection_change(self, pvname=None, conn=None, **kwargs):
+        dropped = None
+        with self.condition:
+            channel = self.channels.get(pvname)
+            # 通道对象赋值前到达的事件由 _create_pv 补发
+            if channel is None or kwargs.get('pv') is not channel.pv:
+                return
+            now = time.time()
+            if conn and not channel.connected:
+                logging.info(f"[Info] PV {pvname} 已连接（恢复耗时 {now - channel.disconnected_since:.3f}s）")
+                channel.timeout_reported = False
+            elif not conn and channel.connected:
+                logging.warning(f"[Warning] PV {pvname} 连接断开，等待 CA 自动重连")
+                channel.disconnected_since = now
+                channel.disconnect_count += 1
+                # 结果图像 PV 断线时在途帧不会再完成回调，直接放弃，重连后发送最新帧
+                frame = self.in_flight_frame
+                if frame is not None and frame.image_pv_name == pvname:
+                    self.in_flight_frame = None
+                    self.dropped_frames += 1
+                    dropped = frame
+            channel.connected = bool(conn)
+            self.condition.notify()
+        self._notify_drop(dropped)
+
+    def _on_put_complete(self, pvname=None, data=None, **kwargs):
+        with self.condition:
+            frame = self.in_flight_frame
+            # 仅接受当前在途帧的图像写入完成（忽略已超时放弃的旧帧）
+            if frame is None or data != frame.frame_id:
+                return
+            complete_time = time.time()
+            latency = complete_time - frame.put_start_time
+            self.put_latency_last = latency
+            self.put_latency_max = max(self.put_latency_max, latency)
+            self.published_frames += 1
+            self.in_flight_frame = None
+            self.condition.notify()
+        if frame.on_complete is not None:
+            frame.on_complete(complete_time)
+
+    def _notify_drop(self, frame):
+        # 在锁外调用，回调中不得调用 CA 接口
+        if frame is not None and frame.on_drop is not None:
+            frame.on_drop(time.time())
+
+    # ---------------- 后台线程 ----------------
+    def _create_pv(self, channel):
+        # 需在锁外调用：创建通道时 CA 回调线程可能需要获取锁
+        # 每个 PV 只创建一次通道：pyepics 按 PV 名缓存 CA 通道，重建 PV 对象并不会建立新连接，
+        # 断线后由 CA 客户端库重新搜索、重连并恢复监控订阅
+        if channel.monitor_callback is not None:
+            # form='time' 订阅 DBR_TIME 数据，回调的 timestamp 为 IOC 时间戳而非本地接收时间
+            pv = epics.PV(channel.pv_name, form='time', auto_monitor=True,
+                          connection_callback=self._on_connection_change)
+            pv.add_callback(channel.monitor_callback)
+        else:
+            pv = epics.PV(channel.pv_name, connection_callback=self._on_connection_change)
+        with self.condition:
+            channel.pv = pv
+        # 补发通道对象赋值前可能被忽略的连接事件
+        if pv.connected:
+            self._on_connection_change(pvname=channel.pv_name, conn=True, pv=pv)
+
+    # 以下 _frame_ready / _put_timed_out / _connect_timed_out / _work_due 均需在持有锁时调用
+    def _frame_ready(self):
+        """没有在途帧，且待发送帧的结果图像 PV 已连接"""
+        frame = self.pending_frame
+        return (frame is not None and self.in_flight_frame is None
+                and self.channels[frame.image_pv_name].connected)
+
+    def _put_timed_out(self, now):
+        frame = self.in_flight_frame
+        return frame is not None and now - frame.put_start_time > self.PUT_TIMEOUT
+
+    def _connect_timed_out(self, channel, now):
+        return (not channel.connected and not channel.timeout_reported
+                and now - channel.disconnected_since >= self.CONNECT_TIMEOUT)
+
+    def _work_due(self, now):
+        return (not self.running
+                or self._frame_ready()
+                or self._put_timed_out(now)
+                or any(self._connect_timed_out(channel, now) for channel in self.channels.values())
+                or now - self.last_status_log_time >= self.STATUS_LOG_INTERVAL)
+
+    def _manage_loop(self):
+        while True:
+            with self.condition:
+                # 先检查已到期的工作再等待，锁外期间到达的通知不会丢失
+                while not self._work_due(time.time()):
+                    self.condition.wait(timeout=self.POLL_INTERVAL)
+                if not self.running:
+                    break
+                now = time.time()
+
+                # 每次未连接只警告一次，恢复连接后重新计时
+                for channel in self.channels.values():
+                    if self._connect_timed_out(channel, now):
+                        channel.timeout_reported = True
+                        logging.warning(
+                            f"[Warning] PV {channel.pv_name} 已 {now - channel.disconnected_since:.1f}s 未连接，"
+                            f"继续等待 CA 自动重连"
+                        )
+
+                # 图像写入超时视为丢失，允许发送下一帧
+                timed_out = None
+                if self._put_timed_out(now):
+                    logging.warning(f"[Warning] 结果帧写入 {self.PUT_TIMEOUT}s 未完成，放弃等待")
+                    timed_out = self.in_flight_frame
+                    self.in_flight_frame = None
+                    self.dropped_frames += 1
+
+                frame = None
+                if self._frame_ready():
+                    frame = self.pending_frame
+                    self.pending_frame = None
+                    frame.put_start_time = now
+                    self.in_flight_frame = frame
+                    # 跳过未连接的元数据 PV，图像始终写入
+                    puts = [(self.channels[name].pv, value) for name, value in frame.puts[:-1]
+                            if self.channels[name].connected]
+                    self.skipped_metadata_puts += len(frame.puts) - 1 - len(puts)
+                    puts.append((self.channels[frame.image_pv_name].pv, frame.puts[-1][1]))
+
+            self._notify_drop(timed_out)
+
+            # 在锁外发出 CA 写入，避免与 CA 回调互相等待
+            if frame is not None:
+                self._send_frame(frame, puts)
+
+            if time.time() - self.last_status_log_time >= self.STATUS_LOG_INTERVAL:
+                self._log_status()
+
+    def _send_frame(self, frame, puts):
+        # 元数据依次写入，最后写入图像，以图像的完成回调作为整帧完成
+        # 单个元数据写入失败只记录日志，不影响图像发布
+        for pv, value in puts[:-1]:
+            try:
+                pv.put(value, wait=False)
+            except Exception as e:
+                logging.warning(f"[Warning] 写入元数据 PV {pv.pvname} 时出错: {e}")
+        try:
+            image_pv, image = puts[-1]
+            image_pv.put(image, wait=False, callback=self._on_put_complete, callback_data=frame.frame_id)
+        except Exception as e:
+            logging.error(f"[Error] 发布结果帧时出错: {e}")
+            with self.condition:
+                if self.in_flight_frame is not frame:
+                    return
+                self.in_flight_frame = None
+                self.dropped_frames += 1
+                self.condition.notify()
+            self._notify_drop(frame)
+
+    def _log_status(self):
+        self.last_status_log_time = time.time()
+        status = self.get_status()
+        for name, channel_status in status['channels'].items():
+            logging.info(
+                f"[Info] CA状态 {name}: {'已连接' if channel_status['connected'] else '未连接'}，"
+                f"断线次数 {channel_status['disconnect_count']}"
+            )
+        latency = status['put_latency_last']
+        latency_text = f"{latency * 1000:.1f}ms" if latency is not None else '-'
+        logging.info(
+            f"[Info] 结果发布: 完成 {status['published_frames']} 帧，合并/丢弃 {status['dropped_frames']} 帧，"
+            f"跳过未连接元数据 {status['skipped_metadata_puts']} 项，"
+            f"写入完成延迟 {latency_text}（最大 {status['put_latency_max'] * 1000:.1f}ms）"
+        )
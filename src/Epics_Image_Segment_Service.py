@@ -5,19 +5,24 @@
 import os
 import time
 import yaml
-import epics
 import logging
 
 import numpy as np
+from functools import partial
 from threading import Thread
 from queue import Queue  # 引入队列
 
 # 自定义模块
 import Image_Processor
+from Overload_Controller import OverloadController
+from Frame_Archiver import FrameArchiver
+from Frame_Tracer import FrameTracer
+from Beam_Statistics import compute_beam_statistics, SCALAR_FIELDS, ARRAY_FIELDS
+from CA_Connection_Manager import CAConnectionManager
 from utils.utils import *
 
-# 读取全局配置参数
-config_path = '../config/config.yaml'
+# 读取全局配置参数（可通过环境变量 DENOISER_CONFIG 指定配置文件）
+config_path = os.environ.get('DENOISER_CONFIG', '../config/config.yaml')
 
 config_file = open(config_path)
 config = yaml.safe_load(config_file)
@@ -25,6 +30,10 @@ config = yaml.safe_load(config_file)
 # 从配置文件中读取参数
 IMAGE_PV_NAME = config['PV_CONFIG']['IMAGE_PV_NAME']
 RESULT_PV_NAME = config['PV_CONFIG']['RESULT_PV_NAME']
+RESULT_PATH_PV_NAME = config['PV_CONFIG']['RESULT_PATH_PV_NAME']
+RESULT_ID_PV_NAME = config['PV_CONFIG']['RESULT_ID_PV_NAME']
+RESULT_SOURCE_TS_PV_NAME = config['PV_CONFIG']['RESULT_SOURCE_TS_PV_NAME']
+BEAM_STATS_PV_PREFIX = config['PV_CONFIG']['BEAM_STATS_PV_PREFIX']
 IMAGE_WIDTH = config['PV_CONFIG']['IMAGE_WIDTH']
 IMAGE_HEIGHT = config['PV_CONFIG']['IMAGE_HEIGHT']
 YOLO_MODEL_PATH = config['ENVIRON_CONFIG']['YOLO_MODEL_PATH']
@@ -40,7 +49,15 @@ os.environ["CUDA_VISIBLE_DEVICES"] = CUDA_VISIBLE_DEVICES
 # 定义 EPICS PV 名称
 IMAGE_PV_NAME = IMAGE_PV_NAME  # 替换为实际的图像 PV 名称
 RESULT_PV_NAME = RESULT_PV_NAME  # 替换为实际的结果 PV 名称
-RESULT_PV = epics.PV(RESULT_PV_NAME) #  结果PV对象
+# 束流统计PV名称（质心、RMS尺寸、积分强度等标量及X/Y投影）
+BEAM_STATS_PV_NAMES = {field: BEAM_STATS_PV_PREFIX + field for field in SCALAR_FIELDS + ARRAY_FIELDS}
+
+# CA连接管理器：连接状态跟踪、结果按帧整体合并（只保留最新帧）
+ca_manager = CAConnectionManager(config)
+# 预先建立结果PV通道：帧序号、采集时间戳、处理路径、束流统计、结果图像
+for pv_name in [RESULT_ID_PV_NAME, RESULT_SOURCE_TS_PV_NAME, RESULT_PATH_PV_NAME,
+                *BEAM_STATS_PV_NAMES.values(), RESULT_PV_NAME]:
+    ca_manager.add_pv(pv_name)
 
 # 设置logging输出对象
 fh = logging.FileHandler(config['LOGGING_CONFIG']['SERVICE_LOG_FILE'], encoding='utf-8')
@@ -54,6 +71,30 @@ root.addHandler(fh)
 
 # 创建任务队列
 task_queue = Queue()
+# 过载控制器
+overload_controller = OverloadController(config)
+# 帧归档器（可选，在主函数中按配置创建）
+frame_archiver = None
+# 帧链路追踪器
+frame_tracer = FrameTracer(config)
+
+# 结果帧发布完成回调（CA回调线程中执行，不得调用CA接口）
+def on_frame_published(trace, handoff_time, publish_time):
+    trace.mark_published(publish_time)
+    trace.add_span('publish', handoff_time, publish_time)
+    logging.info(f"[Info] 处理后的图像已发送到 PV: {RESULT_PV_NAME}（帧序号: {trace.seq_id}，处理路径: {trace.path}）")
+    # 打印PV写入耗时（交给连接管理器至图像写入完成）
+    logging.info(f"[Debug] PV写入耗时: {publish_time - handoff_time:.2f}s")
+    # 打印从IOC采集到结果发布的端到端耗时
+    logging.info(f"[Debug] 端到端耗时: {trace.end_to_end_latency:.2f}s")
+    frame_tracer.finish(trace)
+
+# 结果帧被新帧覆盖或写入失败时的回调
+def on_frame_dropped(trace, handoff_time, drop_time):
+    trace.mark_dropped(drop_time)
+    trace.add_span('publish_dropped', handoff_time, drop_time)
+    logging.warning(f"[Warning] 结果帧未发布（被新帧覆盖或写入失败），帧序号: {trace.seq_id}")
+    frame_tracer.finish(trace)
 
 def process_task_queue():
     """
@@ -63,30 +104,83 @@ def process_task_queue():
         try:
             # 从队列中获取任务
             start_time_1 = time.time()
-            image_array = task_queue.get()
-            if image_array is None:
+            task = task_queue.get()
+            if task is None:
                 break  # 如果收到 None，退出线程
+            image_array, trace = task
             # 打印队列取数耗时
             logging.info(f"[Debug] 队列取数耗时: {time.time() - start_time_1:.2f}s")
 
-            # 模型推理
+            # 根据队列深度与帧等待时间选择处理路径
             start_time_2 = time.time()
-            processed_image, preprocess_time, inference_time, postprocess_time = image_detector.process_image(image_array)
-            # 打印模型推理耗时
-            logging.info(f"[Debug] 模型推理耗时: {time.time() - start_time_2:.2f}s")
-            # 打印前处理耗时
-            logging.info(f"[Debug] 前处理耗时: {preprocess_time:.2f}s")
-            # 打印推理耗时
-            logging.info(f"[Debug] 推理耗时: {inference_time:.2f}s")
-            # 打印后处理耗时
-            logging.info(f"[Debug] 后处理耗时: {postprocess_time:.2f}s")
-
-            # 发送处理后的结果到结果 PV
-            start_time_3 = time.time()
-            send_result_to_pv(RESULT_PV_NAME, RESULT_PV, processed_image) 
-            logging.info(f"[Info] 处理后的图像已发送到 PV: {RESULT_PV_NAME}")
-            # 打印PV写入耗时
-            logging.info(f"[Debug] PV写入耗时: {time.time() - start_time_3:.2f}s")
+            trace.add_span('queued', trace.enqueue_time, start_time_2)
+            path = overload_controller.choose_path(task_queue.qsize(), start_time_2 - trace.enqueue_time)
+
+            if path == OverloadController.MODEL_PATH:
+                try:
+                    # 模型推理
+                    processed_image, light_mask, preprocess_time, inference_time, postprocess_time = image_detector.process_image(image_array)
+                except Exception as e:
+                    # 模型故障时本帧走快速路径，保证结果PV持续更新
+                    logging.error(f"[Error] 模型推理出错，本帧改用快速处理路径: {e}")
+                    overload_controller.report_model_result(None, success=False)
+                    path = OverloadController.FALLBACK_PATH
+                else:
+                    overload_controller.report_model_result(time.time() - trace.enqueue_time)
+                    trace.add_stages(start_time_2, [
+                        ('preprocess', preprocess_time),
+                        ('inference', inference_time),
+                        ('postprocess', postprocess_time),
+                    ])
+                    # 打印模型推理耗时
+                    logging.info(f"[Debug] 模型推理耗时: {time.time() - start_time_2:.2f}s")
+                    # 打印前处理耗时
+                    logging.info(f"[Debug] 前处理耗时: {preprocess_time:.2f}s")
+                    # 打印推理耗时
+                    logging.info(f"[Debug] 推理耗时: {inference_time:.2f}s")
+                    # 打印后处理耗时
+                    logging.info(f"[Debug] 后处理耗时: {postprocess_time:.2f}s")
+
+            if path == OverloadController.FALLBACK_PATH:
+                # 快速处理路径（阈值 + 形态学）
+                fallback_start = time.time()
+                processed_image, light_mask = image_detector.fallback_process_image(image_array)
+                trace.add_span('fallback', fallback_start, time.time())
+                # 打印快速处理耗时
+                logging.info(f"[Debug] 快速处理耗时: {time.time() - start_time_2:.2f}s")
+
+            # 基于去噪图像与光斑掩码计算束流统计量
+            start_time_4 = time.time()
+            beam_stats = compute_beam_statistics(processed_image, light_mask)
+            trace.add_span('beam_stats', start_time_4, time.time())
+            # 打印束流统计耗时
+            logging.info(f"[Debug] 束流统计耗时: {time.time() - start_time_4:.2f}s")
+
+            # 发送帧序号、采集时间戳、处理路径、束流统计及处理后的结果到结果 PV
+            # （整帧作为一个单元发布：元数据先于图像写入，且下一帧在本帧图像写入完成后才发出，
+            #   客户端收到图像时对应元数据已更新；发布完成/丢弃由回调记录到帧追踪）
+            handoff_time = time.time()
+            trace.path = OverloadController.PATH_NAMES[path]
+            metadata = {
+                RESULT_ID_PV_NAME: trace.seq_id,
+                RESULT_SOURCE_TS_PV_NAME: trace.source_ts,
+                RESULT_PATH_PV_NAME: path,
+                **{BEAM_STATS_PV_NAMES[field]: value for field, value in beam_stats.items()},
+            }
+            send_result_to_pv(ca_manager, RESULT_PV_NAME, processed_image, metadata,
+                              on_complete=partial(on_frame_published, trace, handoff_time),
+                              on_drop=partial(on_frame_dropped, trace, handoff_time))
+
+            # 提交归档（后台写入，不阻塞处理线程）
+            if frame_archiver is not None:
+                frame_archiver.submit(image_array, processed_image, {
+                    'seq_id': np.int64(trace.seq_id),
+                    'source_ts': trace.source_ts,
+                    'enqueue_time': trace.enqueue_time,
+                    'handoff_time': handoff_time,
+                    'path': np.int8(path),
+                    **{field.lower(): np.float64(beam_stats[field]) for field in SCALAR_FIELDS},
+                })
             # 打印整体处理耗时
             logging.info(f"[Debug] 整体处理耗时: {time.time() - start_time_2:.2f}s")
 
@@ -105,13 +199,20 @@ def on_image_update(pvname=None, value=None, **kwargs):
         logging.warning(f"[Warning] PV {pvname} 的值为空，跳过处理")
         return
 
+    # 分配帧序号并记录IOC采集时间戳及CA传输区间
+    # （图像PV以 form='time' 订阅，timestamp 为 IOC 侧 DBR_TIME 时间戳）
+    trace = frame_tracer.new_trace(kwargs.get('timestamp'))
+    trace.add_span('ca_delivery', trace.source_ts, trace.receive_time)
+
     try:
         # 将 PV 数据转换为图像
         image_array = np.array(value, dtype=np.uint8).reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
-        logging.info(f"[Info] 从 PV {pvname} 获取到新图像数据，形状: {image_array.shape}")
+        logging.info(f"[Info] 从 PV {pvname} 获取到新图像数据，形状: {image_array.shape}（帧序号: {trace.seq_id}）")
 
-        # 将任务放入队列
-        task_queue.put(image_array)
+        # 将任务放入队列（附带帧追踪，入队时间用于过载判断）
+        trace.enqueue_time = time.time()
+        trace.add_span('receive', trace.receive_time, trace.enqueue_time)
+        task_queue.put((image_array, trace))
 
     except Exception as e:
         logging.error(f"[Error] 处理 PV {pvname} 数据时出错: {e}")
@@ -124,13 +225,18 @@ if __name__ == "__main__":
 
     logging.info('[Running Device] ' + str(image_detector.model.device))
 
+    # 按配置启动帧归档器
+    if config['ARCHIVE_CONFIG']['ENABLE']:
+        frame_archiver = FrameArchiver(config)
+        logging.info(f"[Info] 帧归档已启用，归档目录: {config['ARCHIVE_CONFIG']['ARCHIVE_DIR']}")
+
     # 启动任务处理线程
     worker_thread = Thread(target=process_task_queue, daemon=True)
     worker_thread.start()
 
     try:
         # camonitor机制监控图像PV
-        monitor_image_pv(IMAGE_PV_NAME, on_image_update)
+        monitor_image_pv(ca_manager, IMAGE_PV_NAME, on_image_update)
 
         while True:
             time.sleep(0.001)  # 主线程保持运行
@@ -143,6 +249,13 @@ if __name__ == "__main__":
         # 向队列发送 None，通知线程退出
         task_queue.put(None)
         worker_thread.join()
+        # 写完剩余归档帧
+        if frame_archiver is not None:
+            frame_archiver.close()
+        # 断开CA连接（在途帧的完成回调先于追踪导出）
+        ca_manager.close()
+        # 导出剩余帧追踪
+        frame_tracer.flush()
         # 关闭文件
         config_file.close()
         logging.info("===== Shutting Down =====")
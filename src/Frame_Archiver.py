@@ -0,0 +1,159 @@
+import os
+import time
+import glob
+import logging
+
+import h5py
+import numpy as np
+from threading import Thread
+from queue import Queue, Full
+
+class FrameArchiver:
+    """
+    帧归档器：在后台线程中将原始帧、结果帧与逐帧元数据追加写入分块压缩的 HDF5 文件。
+    写入队列有界，磁盘阻塞时直接丢弃新帧，不会阻塞主处理线程。
+    """
+    def __init__(self, config):
+        archive_config = config['ARCHIVE_CONFIG']
+        # 图像尺寸
+        self.IMAGE_WIDTH = config['PV_CONFIG']['IMAGE_WIDTH']
+        self.IMAGE_HEIGHT = config['PV_CONFIG']['IMAGE_HEIGHT']
+        # 归档目录与写入参数
+        self.ARCHIVE_DIR = archive_config['ARCHIVE_DIR']
+        self.FRAMES_PER_FILE = archive_config['FRAMES_PER_FILE']
+        self.COMPRESSION = archive_config['COMPRESSION']
+        # 保留/轮换限制
+        self.MAX_FILES = archive_config['MAX_FILES']
+        self.MAX_TOTAL_BYTES = int(archive_config['MAX_TOTAL_GB'] * 1024 ** 3)
+
+        os.makedirs(self.ARCHIVE_DIR, exist_ok=True)
+
+        # 有界写入缓冲
+        self.buffer = Queue(maxsize=archive_config['BUFFER_SIZE'])
+        self.dropped_frames = 0
+
+        # 当前写入文件
+        self.h5_file = None
+        self.h5_path = None
+        self.frame_count = 0
+
+        # 异常退出遗留的 .part 文件同样计入保留限制，超限时按时间顺序删除
+        stale_files = glob.glob(os.path.join(self.ARCHIVE_DIR, 'frames_*.h5.part'))
+        if stale_files:
+            logging.warning(f"[Warning] 发现 {len(stale_files)} 个未完成的归档文件（上次异常退出遗留）")
+        self._apply_retention()
+
+        self.writer_thread = Thread(target=self._write_loop, daemon=True)
+        self.writer_thread.start()
+
+    def submit(self, raw_image, result_image, metadata):
+        """
+        提交一帧归档任务（非阻塞）。
+
+        参数:
+            raw_image: 原始图像 (H, W) uint8
+            result_image: 处理后图像 (H, W) uint8
+            metadata: 逐帧元数据字典，值为标量
+        """
+        try:
+            self.buffer.put_nowait((raw_image, result_image, metadata))
+        except Full:
+            self.dropped_frames += 1
+            if self.dropped_frames % 100 == 1:
+                logging.warning(f"[Warning] 归档缓冲已满，累计丢弃 {self.dropped_frames} 帧")
+
+    def close(self):
+        """写完缓冲中剩余帧后关闭归档器"""
+        self.buffer.put(None)
+        self.writer_thread.join()
+
+    def _write_loop(self):
+        while True:
+            item = self.buffer.get()
+            if item is None:
+                break
+            try:
+                self._write_frame(*item)
+            except Exception as e:
+                logging.error(f"[Error] 写入归档帧时出错: {e}")
+        self._close_file()
+
+    def _open_file(self, metadata):
+        # 未写完的文件以 .part 结尾，关闭后重命名，读取方只处理完整文件
+        file_name = f"frames_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1e6) % 1000000:06d}.h5"
+        self.h5_path = os.path.join(self.ARCHIVE_DIR, file_name)
+        self.h5_file = h5py.File(self.h5_path + '.part', 'w')
+        self.frame_count = 0
+
+        # 图像数据集：按帧分块压缩，可无限追加
+        for name in ('raw', 'result'):
+            self.h5_file.create_dataset(
+                name,
+                shape=(0, self.IMAGE_HEIGHT, self.IMAGE_WIDTH),
+                maxshape=(None, self.IMAGE_HEIGHT, self.IMAGE_WIDTH),
+                chunks=(1, self.IMAGE_HEIGHT, self.IMAGE_WIDTH),
+                dtype=np.uint8,
+                compression=self.COMPRESSION,
+            )
+        # 元数据：每个字段一个一维数据集
+        meta_group = self.h5_file.create_group('meta')
+        for key, value in metadata.items():
+            meta_group.create_dataset(
+                key, shape=(0,), maxshape=(None,), chunks=(self.FRAMES_PER_FILE,),
+                dtype=np.asarray(value).dtype,
+            )
+
+    def _close_file(self):
+        if self.h5_file is None:
+            return
+        self.h5_file.close()
+        os.replace(self.h5_path + '.part', self.h5_path)
+        logging.info(f"[Info] 归档文件已完成: {self.h5_path}（{self.frame_count} 帧）")
+        self.h5_file = None
+        self._apply_retention()
+
+    def _write_frame(self, raw_image, result_image, metadata):
+        if self.h5_file is None:
+            self._open_file(metadata)
+
+        # 写入前校验元数据字段并完成类型转换，失败时不写入任何数据集，保证各数据集行数一致
+        meta_group = self.h5_file['meta']
+        if set(metadata) != set(meta_group):
+            raise ValueError(f"元数据字段 {sorted(metadata)} 与归档文件字段 {sorted(meta_group)} 不一致，跳过该帧")
+        row = {
+            'raw': np.asarray(raw_image, dtype=np.uint8).reshape(self.IMAGE_HEIGHT, self.IMAGE_WIDTH),
+            'result': np.asarray(result_image, dtype=np.uint8).reshape(self.IMAGE_HEIGHT, self.IMAGE_WIDTH),
+        }
+        datasets = {name: self.h5_file[name] for name in row}
+        for key, value in metadata.items():
+            row['meta/' + key] = np.asarray(value, dtype=meta_group[key].dtype)
+            datasets['meta/' + key] = meta_group[key]
+
+        # 所有数据集同时追加一行
+        index = self.frame_count
+        for name, dataset in datasets.items():
+            dataset.resize(index + 1, axis=0)
+        for name, dataset in datasets.items():
+            dataset[index] = row[name]
+        self.h5_file.flush()
+        self.frame_count += 1
+
+        # 文件轮换
+        if self.frame_count >= self.FRAMES_PER_FILE:
+            self._close_file()
+
+    def _apply_retention(self):
+        # 按文件名（即时间）从旧到新排序，超出数量或总大小限制时删除最旧的文件
+        # 包含异常退出遗留的 .part 文件，但不包含当前正在写入的文件
+        current_part = self.h5_path + '.part' if self.h5_file is not None else None
+        archive_files = sorted(
+            (f for pattern in ('frames_*.h5', 'frames_*.h5.part')
+             for f in glob.glob(os.path.join(self.ARCHIVE_DIR, pattern)) if f != current_part),
+            key=os.path.basename,
+        )
+        total_bytes = sum(os.path.getsize(f) for f in archive_files)
+        while archive_files and (len(archive_files) > self.MAX_FILES or total_bytes > self.MAX_TOTAL_BYTES):
+            oldest = archive_files.pop(0)
+            total_bytes -= os.path.getsize(oldest)
+            os.remove(oldest)
+            logging.info(f"[Info] 归档保留策略删除旧文件: {oldest}")
@@ -0,0 +1,144 @@
+import os
+import glob
+import json
+import time
+import logging
+import itertools
+
+from threading import Thread, Lock
+
+class FrameTrace:
+    """
+    单帧链路追踪：记录帧序号、IOC 采集时间戳及各阶段耗时区间。
+    所有时间均为 time.time() 秒级时间戳。
+    """
+    def __init__(self, seq_id, source_ts, receive_time):
+        self.seq_id = seq_id
+        self.source_ts = source_ts
+        self.receive_time = receive_time
+        self.enqueue_time = None
+        # 发布完成时间（结果图像写入完成）；被合并覆盖或写入失败时为 None
+        self.publish_time = None
+        self.dropped = False
+        # 帧追踪结束时间（发布完成或被丢弃）
+        self.end_time = None
+        self.path = None
+        # 阶段区间列表：(名称, 开始时间, 结束时间)
+        self.spans = []
+
+    def add_span(self, name, start, end):
+        self.spans.append((name, start, end))
+
+    def add_stages(self, start, durations):
+        """
+        按顺序追加若干连续阶段。
+
+        参数:
+            start: 第一个阶段的开始时间
+            durations: [(名称, 耗时), ...]
+        """
+        for name, duration in durations:
+            self.add_span(name, start, start + duration)
+            start += duration
+
+    def mark_published(self, publish_time):
+        self.publish_time = publish_time
+        self.end_time = publish_time
+
+    def mark_dropped(self, drop_time):
+        self.dropped = True
+        self.end_time = drop_time
+
+    @property
+    def end_to_end_latency(self):
+        """从 IOC 采集到结果发布的端到端延迟（秒）"""
+        return self.publish_time - self.source_ts
+
+
+class FrameTracer:
+    """
+    帧追踪器：分配帧序号，缓存已完成的帧追踪，
+    并按 Chrome Trace Event 格式（可用 Perfetto / chrome://tracing 打开）分批导出。
+    """
+    def __init__(self, config):
+        trace_config = config['TRACE_CONFIG']
+        self.ENABLE = trace_config['ENABLE']
+        self.TRACE_DIR = trace_config['TRACE_DIR']
+        self.FRAMES_PER_FILE = trace_config['FRAMES_PER_FILE']
+        # 保留限制：超出文件数或总大小时删除最旧的追踪文件
+        self.MAX_FILES = trace_config['MAX_FILES']
+        self.MAX_TOTAL_BYTES = int(trace_config['MAX_TOTAL_MB'] * 1024 ** 2)
+
+        if self.ENABLE:
+            os.makedirs(self.TRACE_DIR, exist_ok=True)
+
+        self.seq_counter = itertools.count(1)
+        self.finished = []
+        self.lock = Lock()
+        self.export_lock = Lock()
+
+    def new_trace(self, source_ts=None):
+        """在图像回调中创建帧追踪，IOC 未提供时间戳时以接收时间代替"""
+        receive_time = time.time()
+        if source_ts is None:
+            source_ts = receive_time
+        return FrameTrace(next(self.seq_counter), source_ts, receive_time)
+
+    def finish(self, trace):
+        """帧发布完成后提交追踪，攒满一批后在后台线程导出"""
+        if not self.ENABLE:
+            return
+        with self.lock:
+            self.finished.append(trace)
+            if len(self.finished) < self.FRAMES_PER_FILE:
+                return
+            batch, self.finished = self.finished, []
+        Thread(target=self.export, args=(batch,), daemon=True).start()
+
+    def flush(self):
+        """导出剩余的帧追踪（程序退出时调用）"""
+        with self.lock:
+            batch, self.finished = self.finished, []
+        if batch:
+            self.export(batch)
+
+    def export(self, traces):
+        """
+        将一批帧追踪写为 Chrome Trace Event JSON 文件。
+        每帧使用异步事件（以帧序号为 id），使重叠的帧在时间轴上分行显示。
+        """
+        events = []
+        for trace in traces:
+            args = {
+                'seq_id': trace.seq_id,
+                'source_ts': trace.source_ts,
+                'path': trace.path,
+                'dropped': trace.dropped,
+            }
+            if not trace.dropped:
+                args['latency_ms'] = round(trace.end_to_end_latency * 1000, 3)
+            spans = [('frame', trace.source_ts, trace.end_time)] + trace.spans
+            for name, start, end in spans:
+                common = {'name': name, 'cat': 'frame', 'id': trace.seq_id, 'pid': os.getpid(), 'tid': 0}
+                events.append(dict(common, ph='b', ts=start * 1e6, args=args if name == 'frame' else {}))
+                events.append(dict(common, ph='e', ts=end * 1e6))
+
+        file_name = f"trace_{time.strftime('%Y%m%d_%H%M%S')}_{traces[0].seq_id}.json"
+        trace_path = os.path.join(self.TRACE_DIR, file_name)
+        try:
+            with self.export_lock:
+                with open(trace_path, 'w', encoding='utf-8') as f:
+                    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+                logging.info(f"[Info] 已导出 {len(traces)} 帧追踪: {trace_path}")
+                self._apply_retention()
+        except Exception as e:
+            logging.error(f"[Error] 导出帧追踪时出错: {e}")
+
+    def _apply_retention(self):
+        # 按修改时间从旧到新排序，超出数量或总大小限制时删除最旧的文件
+        trace_files = sorted(glob.glob(os.path.join(self.TRACE_DIR, 'trace_*.json')), key=os.path.getmtime)
+        total_bytes = sum(os.path.getsize(f) for f in trace_files)
+        while trace_files and (len(trace_files) > self.MAX_FILES or total_bytes > self.MAX_TOTAL_BYTES):
+            oldest = trace_files.pop(0)
+            total_bytes -= os.path.getsize(oldest)
+            os.remove(oldest)
@@ -1,3 +1,4 @@
+import os
 import cv2
 import yaml
 import time
@@ -7,9 +8,9 @@ import numpy as np
 from ultralytics import YOLO
 
 class ImageProcess:
-    def __init__(self, model_path):
-        # 读取全局配置参数
-        config_path = '../config/config.yaml'
+    def __init__(self, model_path, device=None):
+        # 读取全局配置参数（可通过环境变量 DENOISER_CONFIG 指定配置文件）
+        config_path = os.environ.get('DENOISER_CONFIG', '../config/config.yaml')
         config_file = open(config_path)
         # 定义config对象
         self.config = yaml.safe_load(config_file)
@@ -18,12 +19,21 @@ class ImageProcess:
         self.INPUT_Y = self.config['PV_CONFIG']['IMAGE_HEIGHT']
 
         # YOLO检测模型相关的参数定义
-        self.model = YOLO(model_path).to('cuda:0')
+        # 未指定运行设备时使用配置文件中的设备
+        if device is None:
+            device = self.config['ENVIRON_CONFIG']['YOLO_DEVICE']
+        self.model = YOLO(model_path).to(device)
         self.INPUT_W = self.config['PV_CONFIG']['YOLO_IMAGE_WIDTH']
         self.INPUT_H = self.config['PV_CONFIG']['YOLO_IMAGE_HEIGHT']
 
         self.class_names = ['edges', 'background', 'light']
 
+        # 快速处理路径（非神经网络）相关参数
+        self.FALLBACK_THRESHOLD = self.config['OVERLOAD_CONFIG']['FALLBACK_THRESHOLD']
+        self.FALLBACK_KERNEL = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (self.config['OVERLOAD_CONFIG']['FALLBACK_KERNEL_SIZE'],) * 2
+        )
+
     # 图像前处理
     def preprocess_image(self, raw_image):
         # 1. 中值滤波去除背景噪点
@@ -31,7 +41,7 @@ class ImageProcess:
         image = raw_image.copy()
         # 2. 进行图实例分割前预处理
         h, w = image.shape 
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)  # 单通道灰度图扩展为三通道
         # Calculate width and height and paddings
         r_w = self.INPUT_W / w
         r_h = self.INPUT_H / h
@@ -101,7 +111,10 @@ class ImageProcess:
 
         # 定义目标去除类别
         target_classes = [0, 1]  # 0: edges, 1: background
+        # 定义光斑类别，用于束流统计
+        light_class = self.class_names.index('light')  # 2: light
         orig_h, orig_w = raw_image.shape[:2]
+        light_mask = np.zeros((orig_h, orig_w), dtype=bool)
 
         if pred.masks is not None:
             for mask, cls_id in zip(pred.masks.data.cpu().numpy(), 
@@ -115,10 +128,12 @@ class ImageProcess:
                 )
                 if int(cls_id) in target_classes:
                     seg_image[aligned_mask > 0] = 0
+                elif int(cls_id) == light_class:
+                    light_mask |= aligned_mask > 0
         else:
             print("No masks found in the prediction.")
 
-        return seg_image
+        return seg_image, light_mask
 
     # 整体去噪+检测流程
     def process_image(self, raw_image):
@@ -135,7 +150,51 @@ class ImageProcess:
 
         # 后处理
         start_time = time.time()
-        seg_image = self.postprocess_image(raw_image, image, preds)
+        seg_image, light_mask = self.postprocess_image(raw_image, image, preds)
+        postprocess_time = time.time() - start_time
+
+        return seg_image, light_mask, preprocess_time, inference_time, postprocess_time
+
+    # 批量去噪+检测流程（离线重处理），多帧合并为一次模型推理
+    def process_batch(self, raw_images):
+        # 预处理
+        start_time = time.time()
+        raw_list, image_list = zip(*[self.preprocess_image(raw_image) for raw_image in raw_images])
+        batch = np.concatenate(image_list, axis=0)
+        preprocess_time = time.time() - start_time
+
+        # 模型推理
+        start_time = time.time()
+        with torch.no_grad():
+            preds = self.model(torch.tensor(batch))
+        inference_time = time.time() - start_time
+
+        # 后处理
+        start_time = time.time()
+        seg_images = np.stack([
+            self.postprocess_image(raw_image, image, [pred])[0]
+            for raw_image, image, pred in zip(raw_list, image_list, preds)
+        ])
         postprocess_time = time.time() - start_time
 
-        return seg_image, preprocess_time, inference_time, postprocess_time
\ No newline at end of file
+        return seg_images, preprocess_time, inference_time, postprocess_time
+
+    # 快速处理路径：阈值 + 形态学去除背景，仅需数毫秒，用于过载或模型故障时兜底
+    def fallback_process_image(self, raw_image):
+        # 1. 中值滤波去除背景噪点（与模型路径前处理一致）
+        raw_image = cv2.medianBlur(raw_image, 5)
+        # 2. 固定阈值得到前景二值图
+        _, binary_mask = cv2.threshold(raw_image, self.FALLBACK_THRESHOLD, 255, cv2.THRESH_BINARY)
+        # 3. 开运算去除孤立噪点，闭运算填补光斑内部空洞
+        binary_mask = cv2.morphologyEx(binary_mask, cv2.MORPH_OPEN, self.FALLBACK_KERNEL)
+        binary_mask = cv2.morphologyEx(binary_mask, cv2.MORPH_CLOSE, self.FALLBACK_KERNEL)
+        # 4. 仅保留面积最大的连通域（光斑），其余视为边缘/背景
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(binary_mask, connectivity=8)
+        seg_image = np.zeros_like(raw_image)
+        light_mask = np.zeros(raw_image.shape, dtype=bool)
+        if num_labels > 1:
+            light_label = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+            light_mask = labels == light_label
+            seg_image[light_mask] = raw_image[light_mask]
+
+        return seg_image, light_mask
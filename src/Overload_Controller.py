@@ -0,0 +1,86 @@
+import time
+import logging
+
+class OverloadController:
+    """
+    过载控制器：监控任务队列深度与帧处理延迟，
+    超出截止时间或模型连续故障时，将帧切换至快速处理路径；模型追上后自动切回。
+    """
+    # 处理路径定义（下标与结果路径PV的枚举值一致）
+    MODEL_PATH = 0
+    FALLBACK_PATH = 1
+    PATH_NAMES = ['MODEL', 'FALLBACK']
+
+    def __init__(self, config):
+        overload_config = config['OVERLOAD_CONFIG']
+        # 队列深度上下限（滞回）
+        self.QUEUE_DEPTH_HIGH = overload_config['QUEUE_DEPTH_HIGH']
+        self.QUEUE_DEPTH_LOW = overload_config['QUEUE_DEPTH_LOW']
+        # 单帧延迟截止时间（秒），从入队到处理完成
+        self.LATENCY_DEADLINE = overload_config['LATENCY_DEADLINE']
+        self.LATENCY_EWMA_ALPHA = overload_config['LATENCY_EWMA_ALPHA']
+        # 模型连续失败次数上限
+        self.MAX_MODEL_FAILURES = overload_config['MAX_MODEL_FAILURES']
+        # 进入快速路径后的最短保持时间（秒），避免频繁抖动
+        self.RECOVER_HOLD_TIME = overload_config['RECOVER_HOLD_TIME']
+
+        self.path = self.MODEL_PATH
+        self.latency_ewma = None
+        self.model_failures = 0
+        self.fallback_since = 0.0
+
+    def _enter_fallback(self, reason):
+        if self.path != self.FALLBACK_PATH:
+            logging.warning(f"[Warning] 过载保护触发（{reason}），切换至快速处理路径")
+        self.path = self.FALLBACK_PATH
+        self.fallback_since = time.time()
+
+    def _enter_model(self):
+        logging.info("[Info] 模型已追上实时帧率，切换回模型处理路径")
+        self.path = self.MODEL_PATH
+        # 重新开始统计，避免过载期间的旧延迟立即再次触发
+        self.latency_ewma = None
+        self.model_failures = 0
+
+    def choose_path(self, queue_depth, frame_age):
+        """
+        根据当前队列深度与帧等待时间，决定本帧的处理路径。
+
+        参数:
+            queue_depth: 当前任务队列中待处理帧数
+            frame_age: 本帧自入队起已等待的时间（秒）
+        """
+        if self.path == self.MODEL_PATH:
+            if queue_depth >= self.QUEUE_DEPTH_HIGH:
+                self._enter_fallback(f"队列深度 {queue_depth}")
+            elif frame_age > self.LATENCY_DEADLINE:
+                self._enter_fallback(f"帧等待 {frame_age:.3f}s")
+        elif (queue_depth <= self.QUEUE_DEPTH_LOW
+              and frame_age <= self.LATENCY_DEADLINE
+              and time.time() - self.fallback_since >= self.RECOVER_HOLD_TIME):
+            self._enter_model()
+
+        return self.path
+
+    def report_model_result(self, latency, success=True):
+        """
+        上报模型路径的处理结果。
+
+        参数:
+            latency: 本帧从入队到处理完成的耗时（秒），失败时可为 None
+            success: 模型处理是否成功
+        """
+        if not success:
+            self.model_failures += 1
+            if self.model_failures >= self.MAX_MODEL_FAILURES:
+                self._enter_fallback(f"模型连续失败 {self.model_failures} 次")
+            return
+
+        self.model_failures = 0
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+
+        if self.latency_ewma > self.LATENCY_DEADLINE:
+            self._enter_fallback(f"平均延迟 {self.latency_ewma:.3f}s")
@@ -1,5 +1,4 @@
 # 工具函数合集
-import epics
 
 # 检测框按比例扩展（与按照固定比例截取不同，而是按照检测框真实比例，等比扩展）
 def expand_bbox(x_min, y_min, x_max, y_max, img_width, img_height):
@@ -39,24 +38,31 @@ def expand_bbox(x_min, y_min, x_max, y_max, img_width, img_height):
         new_y_max
     )
 
-# PV操作函数
-def monitor_image_pv(pv_name, callback):
+# PV操作函数（经由 CAConnectionManager，断线由 CA 自动重连）
+def monitor_image_pv(ca_manager, pv_name, callback):
     """
     监控 EPICS PV 的变化，并在变化时调用回调函数。
+    PV 未连接或断线时不抛出异常，由 CA 客户端库自动重连并恢复订阅。
     
     参数:
+        ca_manager: CAConnectionManager 对象
         pv_name: 要监控的 PV 名称
         callback: 当 PV 值变化时调用的回调函数，接收参数 (pvname, value, **kwargs)
     """
-    image_pv = epics.PV(pv_name, form='native', auto_monitor=True)
-    
-    if not image_pv.wait_for_connection(timeout=5.0): # 等待PV连接，超时5秒
-        raise ValueError(f"无法连接到 PV: {pv_name}")
-    
-    # 添加回调函数
-    image_pv.add_callback(callback)
+    ca_manager.monitor(pv_name, callback)
+
+def send_result_to_pv(ca_manager, result_pv_name, result_image, metadata=None, on_complete=None, on_drop=None):
+    """
+    将处理后的图像和检测结果发送回 EPICS。
+    元数据与图像作为一帧整体发布，未发出的旧帧会被新帧整体覆盖，只保留最新帧。
 
-def send_result_to_pv(result_pv_name, result_pv, result_image):
-    """将处理后的图像和检测结果发送回 EPICS"""
-    # 更新 EPICS PV最新值
-    result_pv.put(result_image.flatten(), wait=False)
+    参数:
+        ca_manager: CAConnectionManager 对象
+        result_pv_name: 结果图像 PV 名称
+        result_image: 处理后的图像
+        metadata: 先于图像写入的元数据 {pv_name: value}
+        on_complete: 图像写入完成回调，参数为完成时间
+        on_drop: 该帧被覆盖或写入失败时的回调，参数为丢弃时间
+    """
+    puts = list((metadata or {}).items()) + [(result_pv_name, result_image.flatten())]
+    ca_manager.publish_frame(puts, on_complete=on_complete, on_drop=on_drop)